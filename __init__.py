@@ -1,12 +1,12 @@
 import bpy
-from bpy.props import StringProperty, BoolProperty
-from bpy.types import Operator
+from bpy.props import StringProperty, BoolProperty, EnumProperty, CollectionProperty
+from bpy.types import Operator, OperatorFileListElement
 from bpy_extras.io_utils import ImportHelper
-import os, sys
+import os, sys, io, json, time, threading, hashlib
 
-from .tex.tex_parser import parse_tex
-from .amo.amo_parser import AMOReader
+# Parsers and decoders (and NumPy with them) are imported on first use, registering only loads the UI classes
 from .helpers.nikkireader import NikkiReader
+from .amo.amo_format import FORMAT_VARIANTS, detect_format, png_files, texture_source
 
 bl_info = {
     "name": "Monster Hunter PS2 _amh Importer",
@@ -15,112 +15,404 @@ bl_info = {
     "category": "Import-Export",
 }
 
-class import_amh(Operator, ImportHelper):
+DETAIL_ITEMS = [
+    ('FULL', "Full", "Import the model at full detail"),
+    ('HALF', "Preview (1/2)", "Decimated geometry and half resolution textures, no weights or strip groups"),
+    ('QUARTER', "Preview (1/4)", "Decimated geometry and quarter resolution textures, no weights or strip groups"),
+]
+DETAIL_FACTORS = {'FULL': 1, 'HALF': 2, 'QUARTER': 4}
+
+class AMOImportBase:
+    # Seconds of datablock building per timer tick, keeps the UI responsive
+    build_slice = 0.05
+
+    # One import at a time, NikkiReader's byte order is shared by every parse thread
+    running = None
+
+    dropped = False
+
+    def invoke(self, context, event):
+        # Files dropped on the viewport and preview upgrades import straight away, the format comes from each header
+        if self.upgrade_objects != "" or (self.directory != "" and len(self.files) > 0):
+            self.dropped = self.upgrade_objects == ""
+            return self.execute(context)
+        return ImportHelper.invoke(self, context, event)
+
+    def read_model(self, file):
+        if not self.file_format['container']:
+            return io.BytesIO(file.read())
+
+        file_meta = []
+        file_count = NikkiReader.read_uint32(file)
+
+        for n in range(file_count):
+            # Offset and Size
+            ptr = NikkiReader.read_uint32(file)
+            size = NikkiReader.read_uint32(file)
+            file_meta.append([ptr,size])
+        
+        return NikkiReader.create_subfile(file, file_meta[0][0], file_meta[0][1])
+
+    def start_file(self, entry):
+        settings, self.rebuild_indices = entry
+        self.file_settings = settings
+        filepath = settings['filepath']
+        self.source_path = filepath
+        self.source_name = os.path.basename(filepath)
+        file_format = detect_format(filepath) if settings['auto_detect'] else None
+        if file_format is None:
+            # Fall back to the operator the file was picked with
+            container = settings['operator'] == import_amh.bl_idname
+            file_format = {'variant': None, 'container': container, 'big_endian': settings.get('big_endian', False)}
+            if settings['auto_detect']:
+                print(f"Unrecognised header in '{self.source_name}', reading it as {'an _amh container' if container else 'an AMO file'}.")
+        elif file_format['variant'] is not None:
+            print(f"{self.source_name}: {FORMAT_VARIANTS[file_format['variant']]['label']}")
+        self.file_format = file_format
+        NikkiReader.set_endian(file_format['big_endian'])
+
+        self.tex_path = texture_source(filepath, settings['texture_path']) if settings['load_textures'] else None
+        if settings['load_textures']:
+            print (self.tex_path if self.tex_path is not None else f"No textures found for '{self.source_name}'.")
+        self.png_paths = []
+        self.tex_data = []
+        self.tex_images = []
+        self.mat_uv_transforms = None
+        self.amo_parser = None
+        self.steps = None
+        self.step_count = 0
+        self.step_done = 0
+
+    def execute(self, context):
+        if AMOImportBase.running is not None:
+            self.report({'ERROR'}, "Another Monster Hunter import is still running")
+            return {"CANCELLED"}
+
+        # Operator properties are only read here, everything after works from this snapshot so the worker thread never touches them
+        self.settings = dict(self.as_keywords(ignore=("filter_glob", "import_detail", "reimport", "upgrade_objects", "files", "directory")), operator=self.bl_idname)
+        self.detail = DETAIL_FACTORS[self.import_detail]
+        self.update_existing = self.reimport
+        # Each queued file has its own settings and, when upgrading, the objects to rebuild
+        if self.upgrade_objects != "":
+            self.queue = [(dict(self.settings, **settings), set(indices)) for settings, indices in json.loads(self.upgrade_objects)]
+        elif self.directory != "" and len(self.files) > 0:
+            self.queue = [(dict(self.settings, filepath=os.path.join(self.directory, f.name)), None) for f in self.files if f.name != ""]
+        else:
+            self.queue = [(self.settings, None)]
+
+        if self.dropped:
+            # Nobody picked a format for dropped files, anything that isn't a model (e.g. a _tex.bin) is left out
+            skipped = [os.path.basename(settings['filepath']) for settings, _ in self.queue if detect_format(settings['filepath']) is None]
+            if skipped:
+                self.report({'WARNING'}, f"Skipped files that aren't Monster Hunter models: {', '.join(skipped)}")
+            self.queue = [entry for entry in self.queue if detect_format(entry[0]['filepath']) is not None]
+            if not self.queue:
+                return {"CANCELLED"}
+        self.file_count = len(self.queue)
+        self.imported_parsers = []
+        self.error = None
+        self.created_images = []
+        self.cancel_event = threading.Event()
+
+        if context.window is None or not self.options.is_invoke:
+            # Scripted calls expect the import done when they return, and blender -b has no event loop for a modal operator
+            for entry in self.queue:
+                self.start_file(entry)
+                self.parse_worker()
+                if self.error is not None:
+                    break
+                try:
+                    for _ in self.build_steps():
+                        pass
+                except Exception:
+                    self.error = sys.exc_info()
+                    break
+                self.imported_parsers.append(self.amo_parser)
+                self.amo_parser = None
+            if self.error is not None:
+                self.report_error()
+                self.remove_created()
+                return {"CANCELLED"}
+            return {"FINISHED"}
+
+        AMOImportBase.running = self
+        self.undone = False
+        bpy.app.handlers.undo_pre.append(undo_during_import)
+        self.start_worker(self.queue.pop(0))
+
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.01, window=context.window)
+        wm.modal_handler_add(self)
+        wm.progress_begin(0, 100)
+        return {"RUNNING_MODAL"}
+
+    def start_worker(self, entry):
+        self.start_file(entry)
+        self.worker = threading.Thread(target=self.parse_worker, daemon=True)
+        self.worker.start()
+
+    def parse_worker(self):
+        try:
+            from .tex.tex_parser import read_tex
+            from .tex.tex_atlas import build_atlases
+            from .amo.amo_parser import AMOReader
+
+            if self.tex_path is not None:
+                if os.path.isdir(self.tex_path):
+                    self.png_paths = png_files(self.tex_path)
+                    if not self.png_paths:
+                        print(f"No PNG files found in folder '{self.tex_path}'.")
+                else:
+                    self.tex_data = read_tex(self.tex_path, self.detail)
+
+            if self.cancel_event.is_set():
+                return
+
+            with open(self.source_path, 'rb') as file:
+                amo_parser = AMOReader([])
+                amo_parser.parse_amo(self.read_model(file))
+
+            # Each texture's index into the images that get created
+            if self.file_settings['atlas_textures'] and self.tex_data:
+                self.tex_data, self.tex_images, self.mat_uv_transforms = build_atlases(amo_parser, self.tex_data)
+            else:
+                self.tex_images = list(range(len(self.tex_data)))
+            self.amo_parser = amo_parser
+        except Exception:
+            self.error = sys.exc_info()
+
+    def build_steps(self):
+        tex_list = []
+        previous_images = set(bpy.data.images) if self.update_existing else set()
+        for png_path in self.png_paths:
+            image = bpy.data.images.load(png_path, check_existing=self.update_existing)
+            stat = os.stat(png_path)
+            file_stamp = f"{stat.st_mtime_ns}:{stat.st_size}"
+            if image not in previous_images:
+                self.created_images.append(image)
+            elif image.get("amh_hash") != file_stamp:
+                # check_existing hands back the loaded image as it was, edited files need a reload
+                image.reload()
+            image["amh_hash"] = file_stamp
+            tex_list.append(image.name)
+            yield
+
+        tex_source = os.path.abspath(self.tex_path) if self.tex_path else ""
+        existing_images = {image["amh_index"]: image for image in bpy.data.images if image.get("amh_source") == tex_source} if self.update_existing else {}
+        image_names = []
+        for idx, image_data in enumerate(self.tex_data):
+            image = self.load_texture(image_data, idx, tex_source, existing_images.get(idx))
+            image_names.append(image.name)
+            yield
+        tex_list += [image_names[image_idx] for image_idx in self.tex_images]
+
+        self.amo_parser.image_names = tex_list
+        self.amo_parser.mat_uv_transforms = self.mat_uv_transforms
+        self.amo_parser.share_materials = self.mat_uv_transforms is not None
+        self.amo_parser.rotate_delta = self.file_settings['rotate_delta']
+        self.amo_parser.ignore_additive = self.file_settings['ignore_additive']
+        self.amo_parser.ignore_emissive = self.file_settings['ignore_emissive']
+        self.amo_parser.reimport = self.update_existing
+        self.amo_parser.detail = self.detail
+        self.amo_parser.rebuild_indices = self.rebuild_indices
+        # Kept on each object so it can be re-imported at full detail later
+        self.amo_parser.import_settings = self.file_settings
+        self.amo_parser.source_path = os.path.abspath(self.source_path)
+        yield from self.amo_parser.build_steps(self.source_name)
+
+    def load_texture(self, image_data, idx, tex_source, existing):
+        from .tex.tex_parser import create_image
+        pack_textures = self.file_settings['pack_textures']
+        # Like objects and materials, textures are only hashed when comparing against a previous import
+        image_hash = hashlib.sha1(image_data.tobytes() + bytes([pack_textures])).hexdigest() if self.update_existing else None
+        if existing is not None and existing.get("amh_hash") == image_hash:
+            return existing
+
+        image = create_image(image_data, idx, pack_textures)
+        image["amh_source"] = tex_source
+        image["amh_index"] = idx
+        if image_hash is not None:
+            image["amh_hash"] = image_hash
+        if existing is not None:
+            # Swap the changed texture in everywhere the old one was used
+            name = existing.name
+            existing.user_remap(image)
+            bpy.data.images.remove(existing)
+            image.name = name
+        else:
+            self.created_images.append(image)
+        return image
+
+    def modal(self, context, event):
+        if self.undone:
+            # The undo freed what was built so far, only the references are left to drop
+            self.cancel_event.set()
+            self.imported_parsers.clear()
+            self.amo_parser = None
+            self.created_images.clear()
+            self.finish(context)
+            self.report({'WARNING'}, "Import cancelled by undo")
+            return {"CANCELLED"}
+
+        if event.type == 'Z' and (event.ctrl or event.oskey):
+            # Undo would free the datablocks still being built
+            return {"RUNNING_MODAL"}
+
+        if event.type == 'ESC':
+            self.cancel(context)
+            self.report({'WARNING'}, "Import cancelled")
+            return {"CANCELLED"}
+
+        if event.type != 'TIMER':
+            return {"PASS_THROUGH"}
+
+        if self.worker.is_alive():
+            return {"RUNNING_MODAL"}
+
+        if self.error is None and self.steps is None:
+            self.steps = self.build_steps()
+            self.step_count = len(self.png_paths) + len(self.tex_data) + self.amo_parser.build_step_count()
+
+        if self.error is None:
+            deadline = time.perf_counter() + self.build_slice
+            try:
+                while time.perf_counter() < deadline:
+                    next(self.steps)
+                    self.step_done += 1
+            except StopIteration:
+                self.imported_parsers.append(self.amo_parser)
+                self.amo_parser = None
+                if not self.queue:
+                    self.finish(context)
+                    return {"FINISHED"}
+                self.start_worker(self.queue.pop(0))
+                return {"RUNNING_MODAL"}
+            except Exception:
+                self.error = sys.exc_info()
+
+        if self.error is not None:
+            self.report_error()
+            self.cancel(context)
+            return {"CANCELLED"}
+
+        files_done = self.file_count - len(self.queue) - 1
+        context.window_manager.progress_update((100 * files_done + 10 + 90 * self.step_done // max(self.step_count, 1)) // self.file_count)
+        return {"RUNNING_MODAL"}
+
+    def finish(self, context):
+        AMOImportBase.running = None
+        if undo_during_import in bpy.app.handlers.undo_pre:
+            bpy.app.handlers.undo_pre.remove(undo_during_import)
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+
+    def cancel(self, context):
+        self.cancel_event.set()
+        self.finish(context)
+        self.remove_created()
+
+    def remove_created(self):
+        for amo_parser in self.imported_parsers + [self.amo_parser]:
+            if amo_parser is not None:
+                amo_parser.remove_created()
+        for image in self.created_images:
+            bpy.data.images.remove(image)
+        self.created_images.clear()
+
+    def report_error(self):
+        exc_type, ex, exc_tb = self.error
+        fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
+        print(exc_type, fname, exc_tb.tb_lineno, str(ex))
+        self.report({'ERROR'}, str(ex))
+
+def undo_during_import(*args):
+    # Undo from a menu isn't caught by the modal keymap check
+    if AMOImportBase.running is not None:
+        AMOImportBase.running.undone = True
+
+class import_amh(AMOImportBase, Operator, ImportHelper):
     bl_idname = "mh_import.mh_amh"
     bl_label = "Import Monster Hunter _amh"
 
+    bl_options = {'REGISTER', 'UNDO'}
+
     filename_ext = ".bin"
 
     filter_glob: StringProperty(default="*_amh.bin")
     load_textures: BoolProperty(name="Load Textures", description="Attempt to load textures from a _tex file or a folder.", default=True)
     texture_path: StringProperty(name="Texture Path", description="Leave empty to attempt to load from _tex file", default="")
+    pack_textures: BoolProperty(name="Pack Textures as PNG", description="Keep decoded textures as 8-bit PNG data instead of float pixels, uses a quarter of the memory.", default=False)
+    atlas_textures: BoolProperty(name="Texture Atlas", description="Pack non-tiling textures into shared atlases so materials that only differ by texture can be merged.", default=False)
+    reimport: BoolProperty(name="Update Existing", description="Re-import over the objects and materials previously imported from this file, only rebuilding what changed.", default=False)
+    import_detail: EnumProperty(name="Detail", description="Preview imports are faster and lighter, selected objects can be upgraded to full detail later.", items=DETAIL_ITEMS, default='FULL')
+    upgrade_objects: StringProperty(default="", options={'HIDDEN', 'SKIP_SAVE'})
+    files: CollectionProperty(type=OperatorFileListElement, options={'HIDDEN', 'SKIP_SAVE'})
+    directory: StringProperty(subtype='DIR_PATH', options={'HIDDEN', 'SKIP_SAVE'})
+    auto_detect: BoolProperty(name="Detect Format", description="Read the game and byte order from each file's header, the manual format options only apply when this is off or the header is not recognised.", default=True)
     big_endian: BoolProperty(name="MHG Wii Format", description="Attempt to load data in Big Endian mode.", default=False)
     ignore_emissive: BoolProperty(name="Ignore Emissive", description="Ignore the emissive value, tick this for stages.", default=False)
     ignore_additive: BoolProperty(name="Ignore Additive Alpha", description="Do not handle additive alpha materials.", default=False)
     rotate_delta: BoolProperty(name="Delta Rotation", description="Rotate model for Z-up.", default=True)
 
-    def __init__(self):
-        self.file_meta = []
-
-    def execute(self, context):
-        NikkiReader.set_endian(self.big_endian)
-        try:
-            tex_list = []
-            if self.load_textures:
-                final_path = self.texture_path if self.texture_path != "" and os.path.isabs(self.texture_path) else self.filepath.replace("_amh","_tex")
-                print (final_path)
-
-                if os.path.isdir(final_path):
-                    png_files = [f for f in os.listdir(final_path) if f.lower().endswith(".png")]
-                    if not png_files:
-                        print(f"No PNG files found in folder '{final_path}'.")
-                    else:
-                        for png_file in png_files:
-                            image = bpy.data.images.load(os.path.join(final_path, png_file))
-                            tex_list.append(image.name)
-                else:
-                    tex_list = parse_tex(final_path)
-            
-            with open(self.filepath, 'rb') as file:
-                file_count = NikkiReader.read_uint32(file)
-
-                for n in range(file_count):
-                    # Offset and Size
-                    ptr = NikkiReader.read_uint32(file)
-                    size = NikkiReader.read_uint32(file)
-                    self.file_meta.append([ptr,size])
-                
-                subfile = NikkiReader.create_subfile(file, self.file_meta[0][0], self.file_meta[0][1])
-                amo_parser = AMOReader(tex_list)
-                amo_parser.rotate_delta = self.rotate_delta
-                amo_parser.ignore_additive = self.ignore_additive
-                amo_parser.ignore_emissive = self.ignore_emissive
-                amo_parser.load_amo(subfile, os.path.basename(self.filepath))
-
-            return { "FINISHED" }
-        except Exception as ex:
-            exc_type, exc_obj, exc_tb = sys.exc_info()
-            fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
-            print(exc_type, fname, exc_tb.tb_lineno, str(ex))
-
-        return {"FINISHED"}
-
-class import_amo(Operator, ImportHelper):
+class import_amo(AMOImportBase, Operator, ImportHelper):
     bl_idname = "mh_import.mh_amo"
     bl_label = "Import Monster Hunter AMO (fmod)"
 
+    bl_options = {'REGISTER', 'UNDO'}
+
     filename_ext = ".fmod"
 
     filter_glob: StringProperty(default="*.fmod", options={'HIDDEN'})
     load_textures: BoolProperty(name="Load Textures", description="Attempt to load textures from a _tex file or a folder.", default=False)
     texture_path: StringProperty(name="Texture Path", description="Leave empty to attempt to load from _tex file", default="")
+    pack_textures: BoolProperty(name="Pack Textures as PNG", description="Keep decoded textures as 8-bit PNG data instead of float pixels, uses a quarter of the memory.", default=False)
+    atlas_textures: BoolProperty(name="Texture Atlas", description="Pack non-tiling textures into shared atlases so materials that only differ by texture can be merged.", default=False)
+    reimport: BoolProperty(name="Update Existing", description="Re-import over the objects and materials previously imported from this file, only rebuilding what changed.", default=False)
+    import_detail: EnumProperty(name="Detail", description="Preview imports are faster and lighter, selected objects can be upgraded to full detail later.", items=DETAIL_ITEMS, default='FULL')
+    upgrade_objects: StringProperty(default="", options={'HIDDEN', 'SKIP_SAVE'})
+    files: CollectionProperty(type=OperatorFileListElement, options={'HIDDEN', 'SKIP_SAVE'})
+    directory: StringProperty(subtype='DIR_PATH', options={'HIDDEN', 'SKIP_SAVE'})
+    auto_detect: BoolProperty(name="Detect Format", description="Read the game and byte order from each file's header, the manual format options only apply when this is off or the header is not recognised.", default=True)
     ignore_emissive: BoolProperty(name="Ignore Emissive", description="Ignore the emissive value, tick this for stages.", default=False)
     ignore_additive: BoolProperty(name="Ignore Additive Alpha", description="Do not handle additive alpha materials.", default=False)
     rotate_delta: BoolProperty(name="Delta Rotation", description="Rotate model for Z-up.", default=True)
 
-    file_meta = []
+if hasattr(bpy.types, "FileHandler"):
+    # Blender 4.1+ drag and drop, _amh containers and fmod files are told apart by their header
+    class import_drop(bpy.types.FileHandler):
+        bl_idname = "MH_FH_import"
+        bl_label = "Monster Hunter model"
+        bl_import_operator = "mh_import.mh_amh"
+        bl_file_extensions = ".bin;.fmod"
+
+        @classmethod
+        def poll_drop(cls, context):
+            return context.area is not None and context.area.type == 'VIEW_3D'
+else:
+    import_drop = None
+
+class upgrade_detail(Operator):
+    bl_idname = "mh_import.upgrade_detail"
+    bl_label = "Upgrade Monster Hunter Preview to Full Detail"
+    bl_description = "Re-import the selected preview objects at full detail from their source files"
+    # The import it starts runs modally and pushes the undo step once it's built
+    bl_options = {'REGISTER'}
+
+    @classmethod
+    def poll(cls, context):
+        return AMOImportBase.running is None and any(obj.get("amh_detail", 1) > 1 for obj in context.selected_objects)
 
     def execute(self, context):
-        try:
-            tex_list = []
-            if self.load_textures:
-                final_path = self.texture_path if self.texture_path != "" and os.path.isabs(self.texture_path) else self.filepath.replace("_amh","_tex")
-                print (final_path)
-
-                if os.path.isdir(final_path):
-                    png_files = [f for f in os.listdir(final_path) if f.lower().endswith(".png")]
-                    if not png_files:
-                        print(f"No PNG files found in folder '{final_path}'.")
-                    else:
-                        for png_file in png_files:
-                            image = bpy.data.images.load(os.path.join(final_path, png_file))
-                            tex_list.append(image.name)
-                else:
-                    tex_list = parse_tex(final_path)
-            
-            with open(self.filepath, 'rb') as file:
-                amo_parser = AMOReader(tex_list)
-                amo_parser.rotate_delta = self.rotate_delta
-                amo_parser.ignore_additive = self.ignore_additive
-                amo_parser.ignore_emissive = self.ignore_emissive
-                amo_parser.load_amo(file, os.path.basename(self.filepath))
-
-            return { "FINISHED" }
-        except Exception as ex:
-            exc_type, exc_obj, exc_tb = sys.exc_info()
-            fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
-            print(exc_type, fname, exc_tb.tb_lineno, str(ex))
+        sources = {}
+        for obj in context.selected_objects:
+            settings = obj.get("amh_import")
+            if obj.get("amh_detail", 1) > 1 and settings is not None:
+                settings = settings.to_dict()
+                sources.setdefault(settings["filepath"], (settings, []))[1].append(obj["amh_index"])
 
+        # One import works through every source file, each with the settings it was first imported with
+        bpy.ops.mh_import.mh_amh('INVOKE_DEFAULT', import_detail='FULL', reimport=True, upgrade_objects=json.dumps(list(sources.values())))
         return {"FINISHED"}
 
 def register():
@@ -128,7 +420,11 @@ def register():
     bpy.utils.register_class(MATERIAL_PT_AMHPanel)
     bpy.utils.register_class(import_amh)
     bpy.utils.register_class(import_amo)
+    bpy.utils.register_class(upgrade_detail)
+    if import_drop is not None:
+        bpy.utils.register_class(import_drop)
     bpy.types.TOPBAR_MT_file_import.append(menu_import)
+    bpy.types.VIEW3D_MT_object.append(menu_object)
 
 def unregister():
     del bpy.types.Material.amh_diffuse
@@ -136,12 +432,19 @@ def unregister():
     bpy.utils.unregister_class(MATERIAL_PT_AMHPanel)
     bpy.utils.unregister_class(import_amh)
     bpy.utils.unregister_class(import_amo)
+    bpy.utils.unregister_class(upgrade_detail)
+    if import_drop is not None:
+        bpy.utils.unregister_class(import_drop)
     bpy.types.TOPBAR_MT_file_import.remove(menu_import)
+    bpy.types.VIEW3D_MT_object.remove(menu_object)
 
 def menu_import(self, context):
     self.layout.operator(import_amh.bl_idname, text="Import Monster Hunter model (_amh)")
     self.layout.operator(import_amo.bl_idname, text="Import Monster Hunter model (fmod)")
 
+def menu_object(self, context):
+    self.layout.operator(upgrade_detail.bl_idname, text="Upgrade Monster Hunter Preview")
+
 # UI Stuff
 def register_material_properties():
     bpy.types.Material.amh_diffuse = bpy.props.FloatVectorProperty(
@@ -0,0 +1,14 @@
+import os, sys, types
+
+# The add-on's __init__ needs bpy, so expose the folder as a bare package to
+# reach the parsers and the glTF writer from a plain Python interpreter.
+_package_name = "amh_importer"
+if _package_name not in sys.modules:
+    _package = types.ModuleType(_package_name)
+    _package.__path__ = [os.path.dirname(os.path.abspath(__file__))]
+    sys.modules[_package_name] = _package
+
+from amh_importer.gltf.gltf_writer import main
+
+if __name__ == "__main__":
+    sys.exit(main())
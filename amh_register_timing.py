@@ -0,0 +1,56 @@
+import os, sys, time, argparse, importlib
+
+# Measures what enabling the add-on costs, runs inside Blender:
+#   blender -b --factory-startup --python amh_register_timing.py -- --repeat 20 --max-ms 50
+# Exits non-zero when over budget or when a parser module got loaded by registration.
+
+HEAVY_MODULES = ("numpy", ".amo.amo_parser", ".amo.amo_geometry", ".tex.tex_parser", ".tex.tex_atlas", ".gltf.gltf_writer")
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Time Monster Hunter importer registration.")
+    parser.add_argument('-r', '--repeat', type=int, default=10, help="Register/unregister cycles to average")
+    parser.add_argument('--max-ms', type=float, default=0.0, help="Fail if import plus first register takes longer")
+    args = parser.parse_args(argv)
+
+    addon_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.dirname(addon_dir))
+    addon_name = os.path.basename(addon_dir)
+    modules_before = set(sys.modules)
+
+    start = time.perf_counter()
+    addon = importlib.import_module(addon_name)
+    import_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    addon.register()
+    register_ms = (time.perf_counter() - start) * 1000
+    addon.unregister()
+
+    cycles = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        addon.register()
+        addon.unregister()
+        cycles.append((time.perf_counter() - start) * 1000)
+
+    # Modules Blender already had loaded are not the add-on's cost
+    loaded = set(sys.modules) - modules_before
+    heavy = [name for name in HEAVY_MODULES if (addon_name + name if name.startswith(".") else name) in loaded]
+
+    print(f"import:     {import_ms:8.2f} ms")
+    print(f"register:   {register_ms:8.2f} ms")
+    if cycles:
+        print(f"re-register:{sum(cycles) / len(cycles):8.2f} ms average over {len(cycles)} cycles")
+    print(f"modules:    {len(loaded)} loaded")
+    if heavy:
+        print(f"Registration loaded {', '.join(heavy)}")
+
+    over_budget = args.max_ms > 0 and import_ms + register_ms > args.max_ms
+    if over_budget:
+        print(f"Over the {args.max_ms} ms budget")
+    return 1 if heavy or over_budget else 0
+
+if __name__ == "__main__":
+    # Blender passes script arguments after "--"
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    sys.exit(main(argv))
@@ -0,0 +1,71 @@
+import os, sys, json, socket, argparse, importlib
+
+# Server side runs inside Blender:
+#   blender -b --factory-startup --python amh_worker.py -- serve --socket /tmp/amh.sock
+#   blender -b --factory-startup --python amh_worker.py -- serve --spool /path/to/spool
+# Jobs can be submitted with a plain Python interpreter:
+#   python amh_worker.py submit --socket /tmp/amh.sock model_amh.bin -o model.blend
+
+def submit(socket_path, jobs):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(socket_path)
+    with client, client.makefile('rw') as stream:
+        for job in jobs:
+            stream.write(json.dumps(job) + "\n")
+            stream.flush()
+            print(stream.readline().strip())
+
+def serve(args):
+    # Load the add-on from this folder without needing it installed
+    addon_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.dirname(addon_dir))
+    addon = importlib.import_module(os.path.basename(addon_dir))
+    import bpy
+    if not hasattr(bpy.types, "MH_IMPORT_OT_mh_amh"):
+        addon.register()
+
+    job_server = importlib.import_module(".server.job_server", addon.__name__).JobServer()
+    if args.socket:
+        job_server.serve_socket(args.socket)
+    else:
+        job_server.serve_spool(args.spool)
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Persistent Monster Hunter import worker for Blender.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', help="Run the worker, inside blender -b")
+    source = serve_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--socket', help="Unix socket path to accept jobs on")
+    source.add_argument('--spool', help="Folder to pick up *.json job files from")
+
+    submit_parser = commands.add_parser('submit', help="Send jobs to a running worker")
+    submit_parser.add_argument('--socket', required=True)
+    submit_parser.add_argument('files', nargs='*', help="_amh.bin or .fmod files")
+    submit_parser.add_argument('-o', '--output', default="", help="Output folder or file (.blend, .glb, .gltf, .fbx)")
+    submit_parser.add_argument('-f', '--format', default=".blend", help="Output extension when --output is a folder")
+    submit_parser.add_argument('--options', default="{}", help="Import operator options as JSON")
+    submit_parser.add_argument('--shutdown', action='store_true', help="Stop the worker after these jobs")
+
+    args = parser.parse_args(argv)
+    if args.command == 'serve':
+        serve(args)
+        return 0
+
+    jobs = []
+    options = json.loads(args.options)
+    for filepath in args.files:
+        output_path = args.output
+        if output_path == "" or os.path.isdir(output_path):
+            output_dir = output_path if output_path != "" else os.path.dirname(filepath)
+            output_path = os.path.join(output_dir, os.path.splitext(os.path.basename(filepath))[0] + args.format)
+        jobs.append({'input': os.path.abspath(filepath), 'output': os.path.abspath(output_path), 'options': options})
+    if args.shutdown:
+        jobs.append({'command': "shutdown"})
+    submit(args.socket, jobs)
+    return 0
+
+if __name__ == "__main__":
+    # Blender passes script arguments after "--"
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    sys.exit(main(argv))
@@ -0,0 +1,70 @@
+import os, struct
+from functools import lru_cache
+
+# Block ids the first AMO block can have, see AMOReader.read_block
+AMO_BLOCK_IDS = {0x2, 0x4, 0x5, 0x9, 0xA, 0x20000, 0x30000, 0x40000, 0x50000, 0x60000, 0x70000, 0x80000, 0xA0000, 0xB0000, 0xC0000, 0xF0000}
+
+# Games are told apart by container and byte order, the PS2 games share one layout
+FORMAT_VARIANTS = {
+    'PS2': {'label': "Monster Hunter / MHG / MH2 (PS2)", 'container': True, 'big_endian': False},
+    'WII': {'label': "Monster Hunter G (Wii)", 'container': True, 'big_endian': True},
+    'FRONTIER': {'label': "Monster Hunter Frontier (fmod)", 'container': False, 'big_endian': False},
+}
+
+MAX_CONTAINER_FILES = 4096
+
+def _is_amo(header, big_endian, size_limit):
+    # The AMO header's size has to fit the data, and the first block has to be a known one that fits the AMO
+    if len(header) < 24:
+        return False
+    _, _, amo_size, block_id, _, block_size = struct.unpack('>IIIIII' if big_endian else '<IIIIII', header[:24])
+    return 12 < amo_size <= size_limit and block_id in AMO_BLOCK_IDS and 12 <= block_size <= amo_size - 12
+
+def _format(container, big_endian):
+    variant = next((name for name, info in FORMAT_VARIANTS.items() if info['container'] == container and info['big_endian'] == big_endian), None)
+    return {'variant': variant, 'container': container, 'big_endian': big_endian}
+
+def sniff_format(file, file_size):
+    # An _amh container starts with its file count and the AMO's offset and size, a bare AMO (fmod) with its header.
+    # Containers are checked first, their offset table can look like an AMO header (e.g. a second file at 0x20000)
+    header = file.read(24)
+    for big_endian in (False, True):
+        if len(header) < 12:
+            break
+        file_count, ptr, size = struct.unpack('>III' if big_endian else '<III', header[:12])
+        if 0 < file_count <= MAX_CONTAINER_FILES and 4 + 8 * file_count <= ptr and ptr + size <= file_size:
+            file.seek(ptr)
+            if _is_amo(file.read(24), big_endian, size):
+                return _format(True, big_endian)
+
+    for big_endian in (False, True):
+        if _is_amo(header, big_endian, file_size):
+            return _format(False, big_endian)
+    return None
+
+@lru_cache(maxsize=1024)
+def _detect_format(filepath, mtime, size):
+    with open(filepath, 'rb') as file:
+        return sniff_format(file, size)
+
+def detect_format(filepath):
+    # Cached per path and modification time, batches and re-imports don't read the header again
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return None
+    return _detect_format(os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size)
+
+@lru_cache(maxsize=256)
+def _png_files(folder, mtime):
+    return tuple(os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith(".png"))
+
+def png_files(folder):
+    return list(_png_files(os.path.abspath(folder), os.stat(folder).st_mtime_ns))
+
+def texture_source(filepath, texture_path=""):
+    # A _tex file or a PNG folder, fmod files have no _tex counterpart
+    tex_path = texture_path if texture_path != "" and os.path.isabs(texture_path) else filepath.replace("_amh","_tex")
+    if tex_path == filepath or not os.path.exists(tex_path):
+        return None
+    return tex_path
@@ -0,0 +1,177 @@
+import hashlib
+import numpy as np
+
+from ..helpers.meshclass import MeshClass
+
+def strip_faces(strips):
+    lengths = np.array([len(strip) for strip in strips], dtype=np.int64)
+    tri_counts = np.maximum(lengths - 2, 0)
+    total = int(tri_counts.sum())
+    if total == 0:
+        return np.zeros((0,3), dtype=np.int32), np.zeros(0, dtype=np.int32)
+
+    flat = np.fromiter((vert for strip in strips for vert in strip), dtype=np.int32, count=int(lengths.sum()))
+    strip_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    tri_starts = np.concatenate(([0], np.cumsum(tri_counts)[:-1]))
+
+    face_strip = np.repeat(np.arange(len(strips), dtype=np.int32), tri_counts)
+    local = np.arange(total) - np.repeat(tri_starts, tri_counts)
+    base = np.repeat(strip_starts, tri_counts) + local
+
+    # Triangle strip winding alternates, odd triangles swap the last two
+    odd = local & 1
+    faces = np.stack((flat[base], flat[base + 1 + odd], flat[base + 2 - odd]), axis=1)
+    return faces, face_strip
+
+def _vector_array(values, width):
+    return np.asarray(values, dtype=np.float32).reshape(-1, width)
+
+def _strip_groups(strips, prefix):
+    groups = []
+    for idx, strip in enumerate(strips):
+        if strip:
+            groups.append((f"{prefix}.{str(idx).zfill(3)}", 1 / len(strip), np.unique(strip).tolist()))
+    return groups
+
+def _weight_groups(verts, bones, values, vert_count):
+    # Sum repeated vertex/bone pairs, then batch vertices sharing a bone and weight into one add call
+    if len(verts) == 0:
+        return []
+    keys, inverse = np.unique(bones.astype(np.int64) * vert_count + verts, return_inverse=True)
+    totals = np.bincount(inverse, weights=values).astype(np.float32)
+    key_bones = keys // vert_count
+    key_verts = keys % vert_count
+
+    groups = []
+    for bone in np.unique(key_bones):
+        in_bone = key_bones == bone
+        weights, weight_idx = np.unique(totals[in_bone], return_inverse=True)
+        bone_verts = key_verts[in_bone]
+        groups.append((f"Bone.{str(bone).zfill(3)}", [(float(weight), bone_verts[weight_idx == n].tolist()) for n, weight in enumerate(weights)]))
+    return groups
+
+def cluster_decimate(positions, faces, detail):
+    # Vertex clustering, the vertices in each grid cell merge at their average position and keep the first one's attributes
+    grid = max(2, int(np.sqrt(len(positions)) / detail))
+    low = positions.min(axis=0)
+    cell_size = np.maximum((positions.max(axis=0) - low) / grid, 1e-6)
+    cells = np.minimum(((positions - low) / cell_size).astype(np.int64), grid - 1)
+    cell_ids = (cells[:,0] * (grid + 1) + cells[:,1]) * (grid + 1) + cells[:,2]
+
+    _, keep, remap = np.unique(cell_ids, return_index=True, return_inverse=True)
+    cluster_positions = np.zeros((len(keep), 3), dtype=np.float64)
+    np.add.at(cluster_positions, remap, positions)
+    cluster_positions /= np.bincount(remap)[:, None]
+    return keep, cluster_positions.astype(np.float32), remap[faces].astype(np.int32)
+
+def face_materials(amo_obj, vert_count):
+    faces1, strip1 = strip_faces(amo_obj.get_property('strips'))
+    faces2, strip2 = strip_faces(amo_obj.get_property('strips2'))
+    faces = np.concatenate((faces1, faces2))
+    face_strip = np.concatenate((strip1, strip2))
+
+    # Both strip sets index the material buffer by strip number
+    mat_buffer = np.asarray(amo_obj.get_property('mat_buffer'), dtype=np.int32)
+    face_mats = np.zeros(len(faces), dtype=np.int32)
+    if len(mat_buffer):
+        in_range = face_strip < len(mat_buffer)
+        face_mats[in_range] = mat_buffer[face_strip[in_range]]
+
+    # Strip joins produce degenerate triangles, Blender rejects them as polygons
+    valid = (faces[:,0] != faces[:,1]) & (faces[:,1] != faces[:,2]) & (faces[:,0] != faces[:,2]) & (faces.max(axis=1, initial=0) < vert_count)
+    return faces[valid], face_mats[valid]
+
+def global_materials(amo_obj, face_mats):
+    # Material buffer entries index the object's remap list
+    remaps = np.asarray(amo_obj.get_property('mat_remaps'), dtype=np.int32)
+    global_mats = np.full(len(face_mats), -1, dtype=np.int32)
+    in_range = face_mats < len(remaps)
+    global_mats[in_range] = remaps[face_mats[in_range]]
+    return global_mats
+
+def geometry_hash(amo_obj, arrays):
+    # Raw array bytes plus shapes, the strip lists decide the strip vertex groups
+    digest = hashlib.sha1()
+    for array in arrays:
+        if array is not None:
+            digest.update(np.ascontiguousarray(array).tobytes())
+    for strips in (amo_obj.get_property('strips'), amo_obj.get_property('strips2')):
+        digest.update(np.fromiter((vert for strip in strips for vert in strip), dtype=np.int64).tobytes())
+    digest.update(repr((
+        [None if array is None else array.shape for array in arrays],
+        [[len(strip) for strip in amo_obj.get_property(name)] for name in ('strips', 'strips2')],
+        amo_obj.name, amo_obj.get_property('mat_remaps'), amo_obj.get_property('render_alpha'),
+    )).encode())
+    return digest.hexdigest()
+
+def prepare_object(amo_obj, detail=1, mat_uv_transforms=None, content_hash=False):
+    positions = _vector_array(amo_obj.get_property('vert_buffer'), 3)
+    vert_count = len(positions)
+    faces, face_mats = face_materials(amo_obj, vert_count)
+
+    normals = _vector_array(amo_obj.get_property('vert_normals'), 3)
+    uvs = _vector_array(amo_obj.get_property('vert_uvs'), 2)
+    colors = _vector_array(amo_obj.get_property('vert_cols'), 4)
+
+    source_index = np.arange(vert_count, dtype=np.int32)
+    if detail > 1 and vert_count:
+        keep, positions, faces = cluster_decimate(positions, faces, detail)
+        normals = normals[keep] if len(normals) == vert_count else normals
+        uvs = uvs[keep] if len(uvs) == vert_count else uvs
+        colors = colors[keep] if len(colors) == vert_count else colors
+        source_index = source_index[keep]
+        vert_count = len(positions)
+
+        valid = (faces[:,0] != faces[:,1]) & (faces[:,1] != faces[:,2]) & (faces[:,0] != faces[:,2])
+        faces = faces[valid]
+        face_mats = face_mats[valid]
+
+    # Unit length for custom split normals, zero normals stay zero so Blender falls back to its own
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    normals = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+
+    loops = faces.ravel()
+    loop_uvs = uvs[loops] if len(uvs) == vert_count else None
+    if loop_uvs is not None and mat_uv_transforms is not None:
+        # Move each face's UVs into the atlas area of its material's texture
+        global_mats = global_materials(amo_obj, face_mats)
+        global_mats[global_mats >= len(mat_uv_transforms)] = -1
+        transforms = np.where(global_mats[:, None] >= 0, mat_uv_transforms[np.maximum(global_mats, 0)], [1.0, 1.0, 0.0, 0.0])
+        transforms = np.repeat(transforms, 3, axis=0).astype(np.float32)
+        loop_uvs = loop_uvs * transforms[:, :2] + transforms[:, 2:]
+
+    # Previews skip weights and strip groups
+    weight_verts = []
+    weight_bones = []
+    weight_values = []
+    for idx, weightset in enumerate(amo_obj.get_property('vert_weights') if detail == 1 else []):
+        for bone, value in weightset:
+            weight_verts.append(idx)
+            weight_bones.append(bone)
+            weight_values.append(value)
+    weight_verts = np.asarray(weight_verts, dtype=np.int32)
+    weight_bones = np.asarray(weight_bones, dtype=np.int32)
+    weight_values = np.asarray(weight_values, dtype=np.float32)
+
+    loop_colors = colors[loops] if len(colors) == vert_count else None
+    hash_arrays = (positions, normals, uvs, colors, faces, face_mats, loop_uvs, weight_verts, weight_bones, weight_values)
+
+    return MeshClass(
+        name=amo_obj.name,
+        content_hash=geometry_hash(amo_obj, hash_arrays) if content_hash else None,
+        positions=positions,
+        source_index=source_index,
+        normals=normals,
+        uvs=uvs,
+        colors=colors,
+        faces=faces,
+        face_mats=face_mats,
+        loop_starts=np.arange(0, len(loops), 3, dtype=np.int32),
+        loop_uvs=loop_uvs,
+        loop_colors=loop_colors,
+        weight_verts=weight_verts,
+        weight_bones=weight_bones,
+        weight_values=weight_values,
+        weight_groups=_weight_groups(weight_verts, weight_bones, weight_values, max(vert_count, 1)),
+        strip_groups=_strip_groups(amo_obj.get_property('strips'), "Strip1") + _strip_groups(amo_obj.get_property('strips2'), "Strip2") if detail == 1 else [],
+    )
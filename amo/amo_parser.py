@@ -1,23 +1,16 @@
-import bpy, bmesh
-import math
+import math, os, hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 
-from ..helpers.nikkireader import NikkiReader
-
-class MeshClass:
-    def __init__(self, name: str, **properties):
-        self.name = name
-        self.properties = properties
-    
-    def get_property(self, key, default=None):
-        return self.properties.get(key, default if default is not None else [])
-    
-    def set_property(self, key, value):
-        self.properties[key] = value
+try:
+    import bpy
+except ImportError:
+    bpy = None # Headless use (e.g. glTF export), only parsing is available
 
-    def append_property(self, key, value):
-        if key not in self.properties:
-            self.properties[key] = []
-        self.properties[key].append(value)
+from ..helpers.nikkireader import NikkiReader
+from ..helpers.meshclass import MeshClass
+from .amo_geometry import prepare_object
 
 class AMOReader:
     def __init__(self, img_names):
@@ -30,6 +23,22 @@ class AMOReader:
         self.ignore_emissive = False
         self.ignore_additive = False
         self.rotate_delta = True
+        self.created_materials = []
+        self.created_meshes = []
+        self.created_objects = []
+        self.created_collections = []
+        self.reimport = False
+        self.prep_workers = min(4, os.cpu_count() or 1)
+        self.detail = 1
+        self.rebuild_indices = None
+        self.import_settings = {}
+        # Datablocks are matched on the full path, models in different folders often share a file name
+        self.source_path = ""
+        self.mat_uv_transforms = None
+        self.share_materials = False
+        self.existing_materials = {}
+        self.existing_objects = {}
+        self.mat_hashes = []
     
     def read_block(self, file):
         block_pos = file.tell()
@@ -371,19 +380,7 @@ class amo_reader():
                 file.seek(block_size-12,1)
         return
     '''
-    def parse_tristrip(self,tri_strip):
-        faces = []
-        
-        for n in tri_strip:
-            for i in range(len(n) -2):
-                if i % 2 == 0:
-                    faces.append([n[i],n[i+1],n[i+2]])
-                else:
-                    faces.append([n[i],n[i+2],n[i+1]])
-        
-        return faces
-    
-    def load_amo(self, file, filename):
+    def parse_amo(self, file):
         file.seek(0,0)
 
         amo_header = NikkiReader.read_uint32(file)
@@ -393,217 +390,304 @@ class amo_reader():
         print(amo_size)
         while(file.tell() < amo_size):
             self.read_block(file)
-        
-        mat_names = self.create_materials(filename,self.mat_group)
 
-        self.create_meshes(filename,mat_names)
+    def build_steps(self, filename):
+        # One datablock per step so callers can spread the build over several updates
+        if self.reimport:
+            self.find_existing()
+
+        # Additive alpha is a property of the objects, every material they use gets the additive wiring
+        additive_mats = set()
+        if not self.ignore_additive:
+            for amo_obj in self.obj_group:
+                if amo_obj.get_property('render_alpha') == 2:
+                    additive_mats.update(amo_obj.get_property('mat_remaps'))
 
-    def create_materials(self, filename, material_groups):
         mat_names = []
-        for idx, amo_mat in enumerate(material_groups):
+        shared_mats = {}
+        for idx, amo_mat in enumerate(self.mat_group):
+            additive = idx in additive_mats
+            if self.share_materials:
+                # Materials that only differ by texture index collapse once their textures share an atlas
+                share_key = amo_mat.content_hash(self.ignore_emissive, self.texture_name(amo_mat), additive, ignore=('texture',))
+                if share_key in shared_mats:
+                    mat_names.append(mat_names[shared_mats[share_key]])
+                    self.mat_hashes.append(self.mat_hashes[shared_mats[share_key]])
+                    yield
+                    continue
+                shared_mats[share_key] = idx
+            mat_names.append(self.create_material(filename, idx, amo_mat, additive).name)
+            yield
+        
+        targets = [(idx, amo_obj) for idx, amo_obj in enumerate(self.obj_group) if self.rebuild_indices is None or idx in self.rebuild_indices]
+
+        # Worker threads prepare the next objects' arrays while this thread uploads the current one
+        prep_ahead = self.prep_workers * 2
+        with ThreadPoolExecutor(max_workers=self.prep_workers) as pool:
+            pending = deque(pool.submit(prepare_object, amo_obj, self.detail, self.mat_uv_transforms, self.reimport) for _, amo_obj in targets[:prep_ahead])
+            for n, (idx, amo_obj) in enumerate(targets):
+                if n + prep_ahead < len(targets):
+                    pending.append(pool.submit(prepare_object, targets[n + prep_ahead][1], self.detail, self.mat_uv_transforms, self.reimport))
+                self.create_mesh(filename, mat_names, idx, amo_obj, pending.popleft().result())
+                yield
+
+        if self.reimport and self.rebuild_indices is None:
+            self.remove_stale()
+
+        self.link_objects(filename)
+
+    def link_objects(self, filename):
+        # Objects are linked in one pass once built, so view layer updates happen once per import
+        collection = None
+        if self.reimport:
+            collection = next((col for col in bpy.data.collections if col.get("amh_source") == self.source_path), None)
+        if collection is None:
+            collection = bpy.data.collections.new(filename)
+            collection["amh_source"] = self.source_path
+            self.created_collections.append(collection)
+            bpy.context.scene.collection.children.link(collection)
+
+        for obj in self.created_objects:
+            collection.objects.link(obj)
+
+        if self.created_objects:
+            bpy.context.view_layer.objects.active = self.created_objects[-1]
+
+    def find_existing(self):
+        # Datablocks are tagged with their source file and index when created
+        self.existing_materials = {mat["amh_index"]: mat for mat in bpy.data.materials if mat.get("amh_source") == self.source_path}
+        self.existing_objects = {obj["amh_index"]: obj for obj in bpy.data.objects if obj.get("amh_source") == self.source_path}
+
+    def remove_stale(self):
+        for idx, obj in self.existing_objects.items():
+            if idx >= len(self.obj_group):
+                mesh = obj.data
+                bpy.data.objects.remove(obj)
+                if mesh is not None and mesh.users == 0:
+                    bpy.data.meshes.remove(mesh)
+        for idx, material in self.existing_materials.items():
+            if idx >= len(self.mat_group) and material.users == 0:
+                bpy.data.materials.remove(material)
+        self.existing_objects = {}
+        self.existing_materials = {}
+
+    def build_step_count(self):
+        return len(self.mat_group) + (len(self.obj_group) if self.rebuild_indices is None else len(self.rebuild_indices))
+
+    def remove_created(self):
+        for obj in self.created_objects:
+            bpy.data.objects.remove(obj)
+        for mesh in self.created_meshes:
+            bpy.data.meshes.remove(mesh)
+        for material in self.created_materials:
+            bpy.data.materials.remove(material)
+        for collection in self.created_collections:
+            bpy.data.collections.remove(collection)
+        self.created_objects.clear()
+        self.created_meshes.clear()
+        self.created_materials.clear()
+        self.created_collections.clear()
+
+    def texture_name(self, amo_mat):
+        if not self.image_names:
+            return None
+        return self.image_names[self.tex_group[amo_mat.get_property('texture')].get_property('tex_id')]
+
+    def create_material(self, filename, idx, amo_mat, additive=False):
+        # Hashes are only needed to compare against a previous import
+        mat_hash = amo_mat.content_hash(self.ignore_emissive, self.texture_name(amo_mat), additive) if self.reimport else None
+        self.mat_hashes.append(mat_hash)
+
+        material = self.existing_materials.get(idx)
+        if material is not None:
+            if material.get("amh_hash") == mat_hash:
+                return material
+        else:
             material = bpy.data.materials.new(name=f"{filename} Material {idx}")
-            material.use_nodes = True
-            material.use_backface_culling = False
-            material.blend_method = 'HASHED'
-            material.shadow_method = 'HASHED'
-            material.amh_diffuse = amo_mat.get_property('rgba1')
-            material.amh_ambient = amo_mat.get_property('rgba2')
-            node_tree = material.node_tree
-            nodes = node_tree.nodes
-            links = node_tree.links
-
-            mat_names.append(material.name)
-            
-            for node in nodes:
-                nodes.remove(node)
-                
-            output_node = nodes.new(type='ShaderNodeOutputMaterial')
-            output_node.location = (900,0)
-                
-            diffuse_node = nodes.new(type='ShaderNodeBsdfPrincipled')
-            diffuse_node.name = "AMO BSDF"
-            diffuse_node.location = (500,0)
-            diffuse_node.inputs['Roughness'].default_value = 1.0
-            
-            mat_texture = self.tex_group[amo_mat.get_property('texture')].get_property('tex_id')
-            texture_node = nodes.new(type='ShaderNodeTexImage')
-            texture_node.name = "AMO Texture"
-            texture_node.location = (0,0)
-            if self.image_names:
-                texture = bpy.data.images.get(self.image_names[mat_texture])
-                texture_node.image = texture
-            
-            vertcol_node = nodes.new(type='ShaderNodeVertexColor')
-            vertcol_node.location = (0,-300)
-            vertcol_node.layer_name = "ColRGBA"
-
-            mix_node = nodes.new(type='ShaderNodeMix')
-            mix_node.location = (300,0)
-            mix_node.data_type = 'RGBA'
-            mix_node.blend_type = 'MULTIPLY'
-            mix_node.inputs['Factor'].default_value = 1.0
-
-            rgba1_node = nodes.new(type='ShaderNodeCombineColor')
-            rgba1_node.location = (0,-600)
-            rgba1_node.inputs[0].default_value = amo_mat.get_property('rgba1')[0]
-            rgba1_node.inputs[1].default_value = amo_mat.get_property('rgba1')[1]
-            rgba1_node.inputs[2].default_value = amo_mat.get_property('rgba1')[2]
-
-            rgba2_node = nodes.new(type='ShaderNodeCombineColor')
-            rgba2_node.location = (0,-800)
-            rgba2_node.inputs[0].default_value = amo_mat.get_property('rgba2')[0]
-            rgba2_node.inputs[1].default_value = amo_mat.get_property('rgba2')[1]
-            rgba2_node.inputs[2].default_value = amo_mat.get_property('rgba2')[2]
-            
-            alphamix_node = nodes.new(type='ShaderNodeMath')
-            alphamix_node.name = "AMO Alpha Mix"
-            alphamix_node.location = (300,-300)
-            alphamix_node.operation = 'MULTIPLY'
+            self.created_materials.append(material)
+        material["amh_source"] = self.source_path
+        material["amh_index"] = idx
+        if mat_hash is not None:
+            material["amh_hash"] = mat_hash
+
+        material.use_nodes = True
+        material.use_backface_culling = False
+        material.blend_method = 'HASHED'
+        material.shadow_method = 'HASHED'
+        material.amh_diffuse = amo_mat.get_property('rgba1')
+        material.amh_ambient = amo_mat.get_property('rgba2')
+        node_tree = material.node_tree
+        nodes = node_tree.nodes
+        links = node_tree.links
+
+        
+        for node in nodes:
+            nodes.remove(node)
             
-            links.new(texture_node.outputs['Color'],mix_node.inputs['A'])
-            links.new(vertcol_node.outputs['Color'],mix_node.inputs['B'])
-            links.new(mix_node.outputs['Result'],diffuse_node.inputs[0])
-            links.new(mix_node.outputs['Result'],diffuse_node.inputs[26])
-            links.new(vertcol_node.outputs['Alpha'],alphamix_node.inputs[0])
-            links.new(texture_node.outputs['Alpha'],alphamix_node.inputs[1])
-            links.new(alphamix_node.outputs[0],diffuse_node.inputs[4])
-            links.new(diffuse_node.outputs['BSDF'],output_node.inputs['Surface'])
+        output_node = nodes.new(type='ShaderNodeOutputMaterial')
+        output_node.location = (900,0)
             
-            if self.ignore_emissive == False:
-                color_emit = amo_mat.get_property('emission')
-                avg_emit = (color_emit[0] + color_emit[1] + color_emit[2]) / 3
-                maprange_node = nodes.new(type='ShaderNodeMapRange')
-                maprange_node.location = (300,-600)
-                maprange_node.inputs[0].default_value = avg_emit
-                maprange_node.inputs[1].default_value = 0
-                maprange_node.inputs[2].default_value = 1
-                maprange_node.inputs[3].default_value = -1
-                maprange_node.inputs[4].default_value = 1
-                links.new(maprange_node.outputs[0],diffuse_node.inputs[27])
-        return mat_names
+        diffuse_node = nodes.new(type='ShaderNodeBsdfPrincipled')
+        diffuse_node.name = "AMO BSDF"
+        diffuse_node.location = (500,0)
+        diffuse_node.inputs['Roughness'].default_value = 1.0
+        
+        mat_texture = self.tex_group[amo_mat.get_property('texture')].get_property('tex_id')
+        texture_node = nodes.new(type='ShaderNodeTexImage')
+        texture_node.name = "AMO Texture"
+        texture_node.location = (0,0)
+        if self.image_names:
+            texture = bpy.data.images.get(self.image_names[mat_texture])
+            texture_node.image = texture
+        
+        vertcol_node = nodes.new(type='ShaderNodeVertexColor')
+        vertcol_node.location = (0,-300)
+        vertcol_node.layer_name = "ColRGBA"
+
+        mix_node = nodes.new(type='ShaderNodeMix')
+        mix_node.location = (300,0)
+        mix_node.data_type = 'RGBA'
+        mix_node.blend_type = 'MULTIPLY'
+        mix_node.inputs['Factor'].default_value = 1.0
+
+        rgba1_node = nodes.new(type='ShaderNodeCombineColor')
+        rgba1_node.location = (0,-600)
+        rgba1_node.inputs[0].default_value = amo_mat.get_property('rgba1')[0]
+        rgba1_node.inputs[1].default_value = amo_mat.get_property('rgba1')[1]
+        rgba1_node.inputs[2].default_value = amo_mat.get_property('rgba1')[2]
+
+        rgba2_node = nodes.new(type='ShaderNodeCombineColor')
+        rgba2_node.location = (0,-800)
+        rgba2_node.inputs[0].default_value = amo_mat.get_property('rgba2')[0]
+        rgba2_node.inputs[1].default_value = amo_mat.get_property('rgba2')[1]
+        rgba2_node.inputs[2].default_value = amo_mat.get_property('rgba2')[2]
+        
+        alphamix_node = nodes.new(type='ShaderNodeMath')
+        alphamix_node.name = "AMO Alpha Mix"
+        alphamix_node.location = (300,-300)
+        alphamix_node.operation = 'MULTIPLY'
+        
+        links.new(texture_node.outputs['Color'],mix_node.inputs['A'])
+        links.new(vertcol_node.outputs['Color'],mix_node.inputs['B'])
+        links.new(mix_node.outputs['Result'],diffuse_node.inputs[0])
+        links.new(mix_node.outputs['Result'],diffuse_node.inputs[26])
+        links.new(vertcol_node.outputs['Alpha'],alphamix_node.inputs[0])
+        # Additive materials take their alpha from the texture's colour
+        links.new(texture_node.outputs['Color' if additive else 'Alpha'],alphamix_node.inputs[1])
+        links.new(alphamix_node.outputs[0],diffuse_node.inputs[4])
+        links.new(diffuse_node.outputs['BSDF'],output_node.inputs['Surface'])
+        
+        if self.ignore_emissive == False:
+            color_emit = amo_mat.get_property('emission')
+            avg_emit = (color_emit[0] + color_emit[1] + color_emit[2]) / 3
+            maprange_node = nodes.new(type='ShaderNodeMapRange')
+            maprange_node.location = (300,-600)
+            maprange_node.inputs[0].default_value = avg_emit
+            maprange_node.inputs[1].default_value = 0
+            maprange_node.inputs[2].default_value = 1
+            maprange_node.inputs[3].default_value = -1
+            maprange_node.inputs[4].default_value = 1
+            links.new(maprange_node.outputs[0],diffuse_node.inputs[27])
+        return material
     
-    def create_meshes(self, filename, materials):
-        for amo_obj in self.obj_group:
-            all_strips = amo_obj.get_property('strips') + amo_obj.get_property('strips2')
-            faces = self.parse_tristrip(all_strips)
-            
+    def create_mesh(self, filename, materials, idx, amo_obj, geo):
+        # Geometry is hashed on the worker, material hashes are included since the object links to them by name
+        obj_hash = None
+        if self.reimport:
+            obj_hash = hashlib.sha1(repr((geo.get_property('content_hash'), self.rotate_delta, self.detail, [self.mat_hashes[mat_id] for mat_id in amo_obj.get_property('mat_remaps')])).encode()).hexdigest()
+
+        obj = self.existing_objects.get(idx)
+        if obj is not None and obj.type == 'MESH':
+            if obj.get("amh_hash") == obj_hash:
+                return obj
+            # Rebuild in place so other references to the object and mesh stay valid
+            mesh = obj.data
+            mesh.clear_geometry()
+            mesh.materials.clear()
+            obj.vertex_groups.clear()
+        else:
             mesh = bpy.data.meshes.new(amo_obj.name)
+            self.created_meshes.append(mesh)
             obj = bpy.data.objects.new(f"{filename} {amo_obj.name}", mesh)
-            col = bpy.data.collections[0]
+            self.created_objects.append(obj)
+        obj["amh_source"] = self.source_path
+        obj["amh_index"] = idx
+        if obj_hash is not None:
+            obj["amh_hash"] = obj_hash
+        obj["amh_detail"] = self.detail
+        obj["amh_import"] = self.import_settings
 
-            obj.visible_shadow = False
-            obj.visible_diffuse = False
-            if self.rotate_delta:
-                obj.delta_rotation_euler[0] = math.radians(90)
-            
-            col.objects.link(obj)
-            bpy.context.view_layer.objects.active = obj
-                
-            mesh.from_pydata(amo_obj.get_property('vert_buffer'), [], faces)
-
-            bm = bmesh.new()
-            bm.from_mesh(mesh)
+        obj.visible_shadow = False
+        obj.visible_diffuse = False
+        obj.delta_rotation_euler[0] = math.radians(90) if self.rotate_delta else 0.0
 
-            custom_index_layer = bm.verts.layers.int.new('custom_index')
+        # Geometry arrays come from prepare_object, only the uploads happen here
+        positions = geo.get_property('positions')
+        faces = geo.get_property('faces')
+        mesh.vertices.add(len(positions))
+        mesh.vertices.foreach_set("co", positions.ravel())
+        mesh.loops.add(faces.size)
+        mesh.loops.foreach_set("vertex_index", faces.ravel())
+        mesh.polygons.add(len(faces))
+        mesh.polygons.foreach_set("loop_start", geo.get_property('loop_starts'))
+        if bpy.app.version < (4, 0, 0):
+            mesh.polygons.foreach_set("loop_total", np.full(len(faces), 3, dtype=np.int32))
+        mesh.update(calc_edges=True)
 
-            for i, v in enumerate(bm.verts):
-                v[custom_index_layer] = i
-            
-            bm.to_mesh(mesh)
-            bm.free()
+        custom_index = mesh.attributes.get('custom_index') or mesh.attributes.new('custom_index', 'INT', 'POINT')
+        custom_index.data.foreach_set("value", geo.get_property('source_index'))
 
-            # Adapted from *&'s plugin
-            mesh.polygons.foreach_set("use_smooth", [True] * len(mesh.polygons))
-            mesh.normals_split_custom_set_from_vertices(amo_obj.get_property('vert_normals'))
-            mesh.use_auto_smooth = True  
+        # Adapted from *&'s plugin, 4.1 dropped auto smooth and custom normals apply on their own
+        if bpy.app.version >= (4, 1, 0):
+            mesh.shade_smooth()
+        else:
+            mesh.polygons.foreach_set("use_smooth", np.ones(len(faces), dtype=bool))
+            mesh.use_auto_smooth = True
+        if len(geo.get_property('normals')) == len(positions):
+            mesh.normals_split_custom_set_from_vertices(geo.get_property('normals'))
+    
+        # UVs
+        if not mesh.uv_layers:
+            uv_layer = mesh.uv_layers.new(name="UVMap")
+        else:
+            uv_layer = mesh.uv_layers.active
+        if geo.get_property('loop_uvs') is not None:
+            uv_layer.data.foreach_set("uv", geo.get_property('loop_uvs').ravel())
         
-            # UVs
-            if not mesh.uv_layers:
-                uv_layer = mesh.uv_layers.new(name="UVMap")
-            else:
-                uv_layer = mesh.uv_layers.active
-            for face in mesh.polygons:
-                for vert_idx, loop_idx in zip(face.vertices, face.loop_indices):
-                    uv_layer.data[loop_idx].uv = amo_obj.get_property('vert_uvs')[vert_idx]
-            
-            # Vertex Colors
-            if not mesh.vertex_colors:
-                vert_col = mesh.vertex_colors.new(name="ColRGBA")
-            else:
-                vert_col = mesh.vertex_colors.active
-            for face in mesh.polygons:
-                for vert_idx, loop_idx in zip(face.vertices, face.loop_indices):
-                    vert_col.data[loop_idx].color = amo_obj.get_property('vert_cols')[vert_idx]
+        # Vertex Colors
+        if not mesh.vertex_colors:
+            vert_col = mesh.vertex_colors.new(name="ColRGBA")
+        else:
+            vert_col = mesh.vertex_colors.active
+        if geo.get_property('loop_colors') is not None:
+            vert_col.data.foreach_set("color", geo.get_property('loop_colors').ravel())
+    
+        # Weights Vertex Groups
+        for bone_name, weight_sets in geo.get_property('weight_groups'):
+            vertexw_group = obj.vertex_groups.new(name=bone_name)
+            for weight, verts in weight_sets:
+                vertexw_group.add(verts, weight, 'REPLACE')
         
-            # Weights Vertex Groups
-            
-            for idx, weightset in enumerate(amo_obj.get_property('vert_weights')):
-                for weight in weightset:
-                    bone_name = f"Bone.{str(weight[0]).zfill(3)}"
-                    if bone_name not in obj.vertex_groups:
-                        vertexw_group = obj.vertex_groups.new(name=bone_name)
-                    #print(f"{[idx]} {weight[0]} {weight[1]}")
-                    vertexw_group.add([idx],weight[1],'ADD')
-            
-            # Tri-Strip Vertex Groups
-            for idx, strip in enumerate(amo_obj.get_property('strips')):
-                strip_name = f"Strip1.{str(idx).zfill(3)}"
-                if strip_name not in obj.vertex_groups:
-                    vertex_group = obj.vertex_groups.new(name=strip_name)
-                    weight = 1/len(strip)
-                    for vert in strip:
-                        vertex_group.add([vert], weight, 'REPLACE')
-
-            for idx, strip in enumerate(amo_obj.get_property('strips2')):
-                strip_name = f"Strip2.{str(idx).zfill(3)}"
-                if strip_name not in obj.vertex_groups:
-                    vertex_group = obj.vertex_groups.new(name=strip_name)
-                    weight = 1/len(strip)
-                    for vert in strip:
-                        vertex_group.add([vert], weight, 'REPLACE')
-            
-            for mat_id in amo_obj.get_property('mat_remaps'):
-                mat_name = materials[mat_id]
-                mat_ref = bpy.data.materials.get(mat_name)
-                
-                if mat_name not in obj.data.materials:
-                    obj.data.materials.append(mat_ref)
-            
-            for idx, mat_id in enumerate(amo_obj.get_property('mat_buffer')):
-                strip_name = f"Strip1.{str(idx).zfill(3)}"
-                vert_group = obj.vertex_groups.get(strip_name)
-
-                if vert_group:
-                    group_index = vert_group.index
-                    group_verts = [v.index for v in obj.data.vertices if group_index in [g.group for g in v.groups]]
-                    
-                    for poly in obj.data.polygons:
-                        if any(v in group_verts for v in poly.vertices):
-                            poly.select = True
-                            poly.material_index = mat_id
-                        else:
-                            poly.select = False
-            
-            for idx, mat_id in enumerate(amo_obj.get_property('mat_buffer')):
-                strip_name = f"Strip2.{str(idx).zfill(3)}"
-                vert_group = obj.vertex_groups.get(strip_name)
-
-                if vert_group:
-                    group_index = vert_group.index
-                    group_verts = [v.index for v in obj.data.vertices if group_index in [g.group for g in v.groups]]
-                    
-                    for poly in obj.data.polygons:
-                        if any(v in group_verts for v in poly.vertices):
-                            poly.select = True
-                            poly.material_index = mat_id
-                        else:
-                            poly.select = False
+        # Tri-Strip Vertex Groups
+        for strip_name, weight, verts in geo.get_property('strip_groups'):
+            vertex_group = obj.vertex_groups.new(name=strip_name)
+            vertex_group.add(verts, weight, 'REPLACE')
+        
+        for mat_id in amo_obj.get_property('mat_remaps'):
+            mat_name = materials[mat_id]
+            mat_ref = bpy.data.materials.get(mat_name)
             
-            print(amo_obj.get_property('render_alpha'))
-
-            if self.ignore_additive == False and amo_obj.get_property('render_alpha') == 2:
-                for material in obj.data.materials:
-                    texNode = material.node_tree.nodes.get("AMO Texture")
-                    mixNode = material.node_tree.nodes.get("AMO Alpha Mix")
+            if mat_name not in obj.data.materials:
+                obj.data.materials.append(mat_ref)
+        
+        # Each strip's triangles use the material buffer entry for that strip, which indexes the remap list
+        remaps = amo_obj.get_property('mat_remaps')
+        face_mats = geo.get_property('face_mats')
+        if remaps:
+            slot_lookup = np.array([obj.data.materials.find(materials[mat_id]) for mat_id in remaps], dtype=np.int32)
+            face_mats = np.where(face_mats < len(remaps), slot_lookup[np.minimum(face_mats, len(remaps) - 1)], 0)
+        mesh.polygons.foreach_set("material_index", face_mats.astype(np.int32))
+        
+        print(amo_obj.get_property('render_alpha'))
 
-                    material.node_tree.links.new(texNode.outputs['Color'],mixNode.inputs[1])
\ No newline at end of file
+        return obj
@@ -0,0 +1,256 @@
+import json, os, struct
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from ..helpers.nikkireader import NikkiReader
+from ..amo.amo_parser import AMOReader
+from ..amo.amo_geometry import prepare_object, global_materials
+from ..amo.amo_format import detect_format, texture_source
+from ..tex.tex_parser import read_tex, png_encode
+
+GL_FLOAT = 5126
+GL_UNSIGNED_INT = 5125
+GL_UNSIGNED_SHORT = 5123
+GL_ARRAY_BUFFER = 34962
+GL_ELEMENT_ARRAY_BUFFER = 34963
+
+ACCESSOR_TYPES = {1: 'SCALAR', 2: 'VEC2', 3: 'VEC3', 4: 'VEC4', 16: 'MAT4'}
+COMPONENT_TYPES = {
+    np.dtype(np.float32): GL_FLOAT,
+    np.dtype(np.uint32): GL_UNSIGNED_INT,
+    np.dtype(np.uint16): GL_UNSIGNED_SHORT,
+}
+
+class GLBWriter:
+    def __init__(self):
+        self.buffer = bytearray()
+        self.gltf = {
+            'asset': {'version': '2.0', 'generator': 'ps2-amh-importer'},
+            'scene': 0,
+            'scenes': [{'nodes': []}],
+            'nodes': [],
+            'meshes': [],
+            'materials': [],
+            'textures': [],
+            'images': [],
+            'samplers': [{'magFilter': 9729, 'minFilter': 9987}],
+            'accessors': [],
+            'bufferViews': [],
+            'buffers': [],
+        }
+
+    def add_view(self, data, target=None):
+        self.buffer.extend(b'\x00' * (-len(self.buffer) % 4))
+        view = {'buffer': 0, 'byteOffset': len(self.buffer), 'byteLength': len(data)}
+        if target is not None:
+            view['target'] = target
+        self.buffer.extend(data)
+        self.gltf['bufferViews'].append(view)
+        return len(self.gltf['bufferViews']) - 1
+
+    def add_accessor(self, array, target=None, bounds=False):
+        array = np.ascontiguousarray(array)
+        width = 1 if array.ndim == 1 else array.shape[1]
+        accessor = {
+            'bufferView': self.add_view(memoryview(array).cast('B'), target),
+            'componentType': COMPONENT_TYPES[array.dtype],
+            'count': len(array),
+            'type': ACCESSOR_TYPES[width],
+        }
+        if bounds:
+            accessor['min'] = np.atleast_1d(array.min(axis=0)).tolist()
+            accessor['max'] = np.atleast_1d(array.max(axis=0)).tolist()
+        self.gltf['accessors'].append(accessor)
+        return len(self.gltf['accessors']) - 1
+
+    def add_node(self, node, root=True):
+        self.gltf['nodes'].append(node)
+        idx = len(self.gltf['nodes']) - 1
+        if root:
+            self.gltf['scenes'][0]['nodes'].append(idx)
+        return idx
+
+    def add_image(self, image_data):
+        view = self.add_view(png_encode(image_data))
+        self.gltf['images'].append({'bufferView': view, 'mimeType': 'image/png'})
+        self.gltf['textures'].append({'sampler': 0, 'source': len(self.gltf['images']) - 1})
+        return len(self.gltf['textures']) - 1
+
+    def write(self, filepath):
+        self.buffer.extend(b'\x00' * (-len(self.buffer) % 4))
+        self.gltf['buffers'].append({'byteLength': len(self.buffer)})
+        gltf = {key: value for key, value in self.gltf.items() if value != []}
+        json_data = json.dumps(gltf, separators=(',', ':')).encode('utf-8')
+        json_data += b' ' * (-len(json_data) % 4)
+
+        with open(filepath, 'wb') as file:
+            file.write(struct.pack('<III', 0x46546C67, 2, 28 + len(json_data) + len(self.buffer)))
+            file.write(struct.pack('<II', len(json_data), 0x4E4F534A))
+            file.write(json_data)
+            file.write(struct.pack('<II', len(self.buffer), 0x004E4942))
+            file.write(self.buffer)
+
+def skin_attributes(geo, joint_lookup):
+    vert_count = len(geo.get_property('positions'))
+    joints = np.zeros((vert_count, 4), dtype=np.uint16)
+    weights = np.zeros((vert_count, 4), dtype=np.float32)
+
+    verts = geo.get_property('weight_verts')
+    bones = geo.get_property('weight_bones')
+    values = geo.get_property('weight_values')
+
+    # Keep the 4 strongest influences per vertex
+    order = np.lexsort((-values, verts))
+    verts, bones, values = verts[order], bones[order], values[order]
+    first = np.searchsorted(verts, verts)
+    rank = np.arange(len(verts)) - first
+    keep = rank < 4
+    joints[verts[keep], rank[keep]] = joint_lookup[bones[keep]]
+    weights[verts[keep], rank[keep]] = values[keep]
+
+    totals = weights.sum(axis=1)
+    weights[totals > 0] /= totals[totals > 0, None]
+    weights[totals <= 0, 0] = 1.0
+    return joints, weights
+
+def unit_normals(normals, positions, faces):
+    # glTF requires unit normals, zero ones get their faces' area weighted normal, or +Y without faces
+    missing = ~np.any(normals, axis=1)
+    if not missing.any():
+        return normals
+    corners = positions[faces]
+    face_normals = np.cross(corners[:,1] - corners[:,0], corners[:,2] - corners[:,0])
+    vert_normals = np.zeros(positions.shape, dtype=np.float64)
+    for corner in range(3):
+        np.add.at(vert_normals, faces[:,corner], face_normals)
+    lengths = np.linalg.norm(vert_normals, axis=1, keepdims=True)
+    fallback = np.where(lengths > 0, vert_normals / np.where(lengths > 0, lengths, 1.0), [0.0, 1.0, 0.0])
+    normals = normals.copy()
+    normals[missing] = fallback[missing]
+    return normals
+
+def amo_to_glb(amo_parser, tex_list, filepath, filename):
+    writer = GLBWriter()
+    tex_map = {}
+    mat_map = {}
+
+    def material_index(global_idx):
+        if global_idx not in mat_map:
+            amo_mat = amo_parser.mat_group[global_idx]
+            material = {
+                'name': f"{filename} Material {global_idx}",
+                'pbrMetallicRoughness': {'metallicFactor': 0.0, 'roughnessFactor': 1.0},
+                'alphaMode': 'BLEND',
+                'doubleSided': True,
+            }
+            tex_group = amo_mat.get_property('texture')
+            if tex_group < len(amo_parser.tex_group):
+                tex_id = amo_parser.tex_group[tex_group].get_property('tex_id')
+                if tex_id < len(tex_list):
+                    if tex_id not in tex_map:
+                        tex_map[tex_id] = writer.add_image(tex_list[tex_id])
+                    material['pbrMetallicRoughness']['baseColorTexture'] = {'index': tex_map[tex_id]}
+            writer.gltf['materials'].append(material)
+            mat_map[global_idx] = len(writer.gltf['materials']) - 1
+        return mat_map[global_idx]
+
+    geometries = [prepare_object(amo_obj) for amo_obj in amo_parser.obj_group]
+
+    all_bones = np.unique(np.concatenate([geo.get_property('weight_bones') for geo in geometries] + [np.zeros(0, dtype=np.int32)]))
+    skin = None
+    if len(all_bones):
+        joint_lookup = np.zeros(all_bones.max() + 1, dtype=np.uint16)
+        joint_lookup[all_bones] = np.arange(len(all_bones))
+        joint_nodes = [writer.add_node({'name': f"Bone.{str(bone).zfill(3)}"}) for bone in all_bones]
+        inverse_binds = np.tile(np.eye(4, dtype=np.float32).reshape(1, 16), (len(all_bones), 1))
+        writer.gltf['skins'] = [{'joints': joint_nodes, 'inverseBindMatrices': writer.add_accessor(inverse_binds)}]
+        skin = 0
+
+    for amo_obj, geo in zip(amo_parser.obj_group, geometries):
+        faces = geo.get_property('faces')
+        positions = geo.get_property('positions')
+        if len(faces) == 0 or len(positions) == 0:
+            continue
+
+        attributes = {'POSITION': writer.add_accessor(positions, GL_ARRAY_BUFFER, bounds=True)}
+        normals = geo.get_property('normals')
+        if len(normals) == len(positions):
+            attributes['NORMAL'] = writer.add_accessor(unit_normals(normals, positions, faces), GL_ARRAY_BUFFER)
+        uvs = geo.get_property('uvs')
+        if len(uvs) == len(positions):
+            # glTF samples from the top-left corner
+            attributes['TEXCOORD_0'] = writer.add_accessor(np.column_stack((uvs[:, 0], 1.0 - uvs[:, 1])), GL_ARRAY_BUFFER)
+        colors = geo.get_property('colors')
+        if len(colors) == len(positions):
+            attributes['COLOR_0'] = writer.add_accessor(np.clip(colors, 0.0, 1.0), GL_ARRAY_BUFFER)
+        node = {'name': f"{filename} {geo.name}"}
+        if skin is not None and len(geo.get_property('weight_verts')):
+            joints, weights = skin_attributes(geo, joint_lookup)
+            attributes['JOINTS_0'] = writer.add_accessor(joints, GL_ARRAY_BUFFER)
+            attributes['WEIGHTS_0'] = writer.add_accessor(weights, GL_ARRAY_BUFFER)
+            node['skin'] = skin
+
+        # Faces resolve to global materials through the remap list, the same way the Blender import does
+        face_mats = global_materials(amo_obj, geo.get_property('face_mats'))
+        primitives = []
+        for mat_id in np.unique(face_mats):
+            indices = faces[face_mats == mat_id].astype(np.uint32).ravel()
+            primitive = {'attributes': attributes, 'indices': writer.add_accessor(indices, GL_ELEMENT_ARRAY_BUFFER)}
+            if 0 <= mat_id < len(amo_parser.mat_group):
+                primitive['material'] = material_index(int(mat_id))
+            primitives.append(primitive)
+
+        writer.gltf['meshes'].append({'name': geo.name, 'primitives': primitives})
+        node['mesh'] = len(writer.gltf['meshes']) - 1
+        writer.add_node(node)
+
+    writer.write(filepath)
+
+def export_glb(filepath, output_path, texture_path="", big_endian=False):
+    # The header decides the container and byte order, the extension and flag are only used if it isn't recognised
+    file_format = detect_format(filepath)
+    if file_format is None:
+        file_format = {'container': not filepath.lower().endswith(".fmod"), 'big_endian': big_endian}
+    NikkiReader.set_endian(file_format['big_endian'])
+    tex_path = texture_source(filepath, os.path.abspath(texture_path) if texture_path != "" else "")
+    tex_list = read_tex(tex_path) if tex_path is not None and os.path.isfile(tex_path) else []
+
+    with open(filepath, 'rb') as file:
+        amo_parser = AMOReader([])
+        if not file_format['container']:
+            amo_parser.parse_amo(file)
+        else:
+            file_count = NikkiReader.read_uint32(file)
+            file_meta = [[NikkiReader.read_uint32(file), NikkiReader.read_uint32(file)] for _ in range(file_count)]
+            amo_parser.parse_amo(NikkiReader.create_subfile(file, file_meta[0][0], file_meta[0][1]))
+
+    amo_to_glb(amo_parser, tex_list, output_path, os.path.basename(filepath))
+    return output_path
+
+def _export_job(args):
+    return export_glb(*args)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert Monster Hunter _amh/fmod models to binary glTF without Blender.")
+    parser.add_argument('files', nargs='+', help="_amh.bin or .fmod files")
+    parser.add_argument('-o', '--output', default="", help="Output folder, defaults to next to each input")
+    parser.add_argument('-t', '--textures', default="", help="_tex.bin file, defaults to the matching _tex file")
+    parser.add_argument('-b', '--big-endian', action='store_true', help="MHG Wii Format, for files whose header isn't recognised")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="Files to convert in parallel")
+    args = parser.parse_args(argv)
+
+    jobs = []
+    for filepath in args.files:
+        output_dir = args.output if args.output != "" else os.path.dirname(filepath)
+        output_path = os.path.join(output_dir, os.path.splitext(os.path.basename(filepath))[0] + ".glb")
+        jobs.append((filepath, output_path, args.textures, args.big_endian))
+
+    if args.jobs <= 1 or len(jobs) == 1:
+        for job in jobs:
+            print(_export_job(job))
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            for output_path in pool.map(_export_job, jobs):
+                print(output_path)
+    return 0
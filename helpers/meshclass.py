@@ -0,0 +1,21 @@
+import hashlib
+
+class MeshClass:
+    def __init__(self, name: str, **properties):
+        self.name = name
+        self.properties = properties
+    
+    def get_property(self, key, default=None):
+        return self.properties.get(key, default if default is not None else [])
+    
+    def set_property(self, key, value):
+        self.properties[key] = value
+
+    def append_property(self, key, value):
+        if key not in self.properties:
+            self.properties[key] = []
+        self.properties[key].append(value)
+
+    def content_hash(self, *extra, ignore=()):
+        properties = {key: value for key, value in self.properties.items() if key not in ignore}
+        return hashlib.sha1(repr((properties, extra)).encode()).hexdigest()
@@ -0,0 +1,147 @@
+import bpy
+import json, os, socket, time, resource, traceback
+
+def memory_usage():
+    # Resident set size in MB, read from /proc since this only targets Linux
+    with open('/proc/self/statm') as statm:
+        resident_pages = int(statm.read().split()[1])
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / 1048576
+
+def peak_memory_usage():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def reset_scene():
+    # Cheaper than restarting Blender, leaves an empty scene for the next job
+    for datablocks in (bpy.data.objects, bpy.data.meshes, bpy.data.materials, bpy.data.images,
+                       bpy.data.collections, bpy.data.armatures, bpy.data.actions, bpy.data.node_groups):
+        for datablock in list(datablocks):
+            datablocks.remove(datablock)
+    bpy.data.orphans_purge(do_recursive=True)
+
+class JobServer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.jobs_done = 0
+        self.busy_time = 0.0
+
+    def import_model(self, job):
+        # The importer reads the container and byte order from the header, the operator only decides how unrecognised files are read
+        input_path = job['input']
+        if input_path.lower().endswith(".fmod"):
+            import_op = bpy.ops.mh_import.mh_amo
+        else:
+            import_op = bpy.ops.mh_import.mh_amh
+        if 'CANCELLED' in import_op(filepath=input_path, **job.get('options', {})):
+            raise RuntimeError(f"Import failed for {input_path}")
+
+    def write_output(self, job):
+        output_path = job.get('output', "")
+        if output_path == "":
+            return
+        extension = os.path.splitext(output_path)[1].lower()
+        if extension == ".blend":
+            bpy.ops.wm.save_as_mainfile(filepath=output_path, copy=True)
+        elif extension in (".glb", ".gltf"):
+            bpy.ops.export_scene.gltf(filepath=output_path, export_format='GLB' if extension == ".glb" else 'GLTF_SEPARATE')
+        elif extension == ".fbx":
+            bpy.ops.export_scene.fbx(filepath=output_path)
+        else:
+            raise ValueError(f"Unsupported output format '{extension}'")
+
+    def run_job(self, job):
+        start = time.perf_counter()
+        result = {'input': job.get('input'), 'output': job.get('output', "")}
+
+        memory_before = None
+        try:
+            reset_scene()
+            # Sampled after the reset so freeing the previous job's data doesn't count against this one
+            memory_before = memory_usage()
+            self.import_model(job)
+            result['objects'] = len(bpy.data.objects)
+            self.write_output(job)
+            result['status'] = "done"
+        except Exception as ex:
+            traceback.print_exc()
+            result['status'] = "failed"
+            result['error'] = str(ex)
+
+        elapsed = time.perf_counter() - start
+        self.jobs_done += 1
+        self.busy_time += elapsed
+        memory_after = memory_usage()
+        result.update(
+            seconds=round(elapsed, 3),
+            memory_mb=round(memory_after, 1),
+            memory_delta_mb=round(memory_after - (memory_before if memory_before is not None else memory_after), 1),
+            peak_memory_mb=round(peak_memory_usage(), 1),
+            jobs_done=self.jobs_done,
+            jobs_per_minute=round(60 * self.jobs_done / max(time.perf_counter() - self.started, 1e-6), 2),
+            busy_ratio=round(self.busy_time / max(time.perf_counter() - self.started, 1e-6), 3),
+        )
+        print(json.dumps(result), flush=True)
+        return result
+
+    def serve_spool(self, spool_dir, poll_interval=0.5):
+        # Jobs are *.json files, claimed by renaming so several workers can share a spool
+        os.makedirs(spool_dir, exist_ok=True)
+        print(f"Watching spool folder '{spool_dir}'", flush=True)
+        while True:
+            job_files = sorted(f for f in os.listdir(spool_dir) if f.endswith(".json") and not f.endswith(".result.json"))
+            if not job_files:
+                time.sleep(poll_interval)
+                continue
+
+            for job_file in job_files:
+                job_path = os.path.join(spool_dir, job_file)
+                claimed_path = job_path[:-len(".json")] + ".working"
+                try:
+                    os.rename(job_path, claimed_path)
+                except OSError:
+                    continue
+
+                try:
+                    with open(claimed_path) as file:
+                        job = json.load(file)
+                except ValueError as ex:
+                    job = {'command': "invalid", 'error': str(ex)}
+                if job.get('command') == "shutdown":
+                    os.remove(claimed_path)
+                    return
+
+                result = self.run_job(job) if 'command' not in job else {'status': "failed", 'error': job.get('error', "Unknown command")}
+                with open(job_path[:-len(".json")] + ".result.json", 'w') as file:
+                    json.dump(result, file, indent=2)
+                os.remove(claimed_path)
+
+    def serve_socket(self, socket_path):
+        # One JSON job per line, each answered with one JSON result line
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(socket_path)
+        server.listen()
+        print(f"Listening on '{socket_path}'", flush=True)
+
+        try:
+            while True:
+                connection, _ = server.accept()
+                with connection, connection.makefile('rw') as stream:
+                    for line in stream:
+                        if line.strip() == "":
+                            continue
+                        try:
+                            job = json.loads(line)
+                        except ValueError as ex:
+                            stream.write(json.dumps({'status': "failed", 'error': str(ex)}) + "\n")
+                            stream.flush()
+                            continue
+                        if job.get('command') == "shutdown":
+                            stream.write(json.dumps({'status': "shutdown", 'jobs_done': self.jobs_done}) + "\n")
+                            stream.flush()
+                            return
+                        stream.write(json.dumps(self.run_job(job)) + "\n")
+                        stream.flush()
+        finally:
+            server.close()
+            os.remove(socket_path)
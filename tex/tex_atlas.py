@@ -0,0 +1,90 @@
+import numpy as np
+
+from ..amo.amo_geometry import face_materials, global_materials
+
+def material_textures(amo_parser):
+    mat_textures = []
+    for amo_mat in amo_parser.mat_group:
+        tex_group = amo_mat.get_property('texture')
+        mat_textures.append(amo_parser.tex_group[tex_group].get_property('tex_id') if tex_group < len(amo_parser.tex_group) else -1)
+    return np.asarray(mat_textures, dtype=np.int32)
+
+def texture_uv_bounds(amo_parser, tex_count):
+    # UV range each texture is sampled with, tiling textures can't go in an atlas
+    low = np.full((tex_count, 2), np.inf, dtype=np.float32)
+    high = np.full((tex_count, 2), -np.inf, dtype=np.float32)
+    mat_textures = material_textures(amo_parser)
+
+    for amo_obj in amo_parser.obj_group:
+        uvs = np.asarray(amo_obj.get_property('vert_uvs'), dtype=np.float32).reshape(-1, 2)
+        faces, face_mats = face_materials(amo_obj, len(uvs))
+        global_mats = global_materials(amo_obj, face_mats)
+        in_range = (global_mats >= 0) & (global_mats < len(mat_textures))
+        face_textures = np.full(len(faces), -1, dtype=np.int32)
+        face_textures[in_range] = mat_textures[global_mats[in_range]]
+
+        used = (face_textures >= 0) & (face_textures < tex_count)
+        loop_textures = np.repeat(face_textures[used], 3)
+        loop_uvs = uvs[faces[used].ravel()]
+        np.minimum.at(low, loop_textures, loop_uvs)
+        np.maximum.at(high, loop_textures, loop_uvs)
+    return low, high
+
+def shelf_pack(sizes, max_size):
+    # Tallest first, left to right along shelves, a new atlas once the height runs out
+    placements = [None] * len(sizes)
+    atlas_sizes = []
+    shelf_x = shelf_y = shelf_height = 0
+    for idx in sorted(range(len(sizes)), key=lambda n: (-sizes[n][1], -sizes[n][0])):
+        width, height = sizes[idx]
+        if shelf_x + width > max_size:
+            shelf_x, shelf_y, shelf_height = 0, shelf_y + shelf_height, 0
+        if not atlas_sizes or shelf_y + height > max_size:
+            atlas_sizes.append([0, 0])
+            shelf_x = shelf_y = shelf_height = 0
+        placements[idx] = (len(atlas_sizes) - 1, shelf_x, shelf_y)
+        shelf_x += width
+        shelf_height = max(shelf_height, height)
+        atlas_sizes[-1][0] = max(atlas_sizes[-1][0], shelf_x)
+        atlas_sizes[-1][1] = max(atlas_sizes[-1][1], shelf_y + shelf_height)
+
+    # Power of two atlas sizes
+    atlas_sizes = [[1 << int(np.ceil(np.log2(max(size, 1)))) for size in atlas_size] for atlas_size in atlas_sizes]
+    return placements, atlas_sizes
+
+def build_atlases(amo_parser, textures, max_size=2048, padding=2):
+    # Returns the images to create, the image each texture ends up in and a UV scale/offset per material
+    low, high = texture_uv_bounds(amo_parser, len(textures))
+    # Textures sampled within a single repeat tile can be shifted into the atlas, flipped V puts most in [-1, 0]
+    tiles = np.floor(np.where(np.isfinite(low), low, 0.0) + 1e-3)
+    packable = [idx for idx, image_data in enumerate(textures)
+                if np.all(high[idx] <= tiles[idx] + 1.001)
+                and max(image_data.shape[:2]) + padding * 2 <= max_size]
+
+    sizes = [(textures[idx].shape[1] + padding * 2, textures[idx].shape[0] + padding * 2) for idx in packable]
+    placements, atlas_sizes = shelf_pack(sizes, max_size)
+
+    images = [np.zeros((height, width, 4), dtype=np.uint8) for width, height in atlas_sizes]
+    tex_images = [None] * len(textures)
+    tex_transforms = np.tile(np.array([1.0, 1.0, 0.0, 0.0], dtype=np.float32), (len(textures), 1))
+
+    for idx, (atlas_idx, x, y) in zip(packable, placements):
+        image_data = textures[idx]
+        height, width = image_data.shape[:2]
+        # Edge texels are repeated into the padding so filtering doesn't bleed between textures
+        images[atlas_idx][y:y + height + padding * 2, x:x + width + padding * 2] = np.pad(image_data, ((padding, padding), (padding, padding), (0, 0)), mode='edge')
+        atlas_height, atlas_width = images[atlas_idx].shape[:2]
+        tex_images[idx] = atlas_idx
+        scale_u, scale_v = width / atlas_width, height / atlas_height
+        tex_transforms[idx] = (scale_u, scale_v, (x + padding) / atlas_width - tiles[idx][0] * scale_u, (y + padding) / atlas_height - tiles[idx][1] * scale_v)
+
+    for idx, image_data in enumerate(textures):
+        if tex_images[idx] is None:
+            tex_images[idx] = len(images)
+            images.append(image_data)
+
+    mat_textures = material_textures(amo_parser)
+    mat_uv_transforms = np.tile(np.array([1.0, 1.0, 0.0, 0.0], dtype=np.float32), (len(mat_textures), 1))
+    valid = (mat_textures >= 0) & (mat_textures < len(textures))
+    mat_uv_transforms[valid] = tex_transforms[mat_textures[valid]]
+    return images, tex_images, mat_uv_transforms
@@ -1,40 +1,55 @@
-import bpy
-import io
+import io, struct, zlib
 import numpy as np
 
+try:
+    import bpy
+except ImportError:
+    bpy = None # Headless use (e.g. glTF export), only the decoders are available
+
 from ..helpers.nikkireader import NikkiReader
 
-def pal_rgba32(apx):
-    if NikkiReader._big_endian:
-        c_a = NikkiReader.read_byte(apx) / 255.0
-        c_b = NikkiReader.read_byte(apx) / 255.0
-        c_g = NikkiReader.read_byte(apx) / 255.0
-        c_r = NikkiReader.read_byte(apx) / 255.0
-    else:
-        c_r = NikkiReader.read_byte(apx) / 255.0
-        c_g = NikkiReader.read_byte(apx) / 255.0
-        c_b = NikkiReader.read_byte(apx) / 255.0
-        c_a = NikkiReader.read_byte(apx) / 255.0
-    return [c_r,c_g,c_b,c_a]
-
-def pal_rgba16(apx):
-    if NikkiReader._big_endian:
-        c_a = NikkiReader.read_uint4(apx,True) / 255.0
-        apx.seek(-1,1)
-        c_b = NikkiReader.read_uint4(apx) / 255.0
-        c_g = NikkiReader.read_uint4(apx,True) / 255.0
-        apx.seek(-1,1)
-        c_r = NikkiReader.read_uint4(apx) / 255.0
+# PS2 CSM1 CLUTs store 256 colour palettes with entries 8-15 and 16-23 of every 32 swapped
+CLUT_SWIZZLE = np.arange(256, dtype=np.intp)
+CLUT_SWIZZLE = (CLUT_SWIZZLE & ~0x18) | ((CLUT_SWIZZLE & 0x08) << 1) | ((CLUT_SWIZZLE & 0x10) >> 1)
+
+# Channel expansion to 8 bits, the GS treats alpha 0x80 as fully opaque
+EXPAND_4BIT = (np.arange(16) * 17).astype(np.uint8)
+EXPAND_PS2_ALPHA = np.minimum((np.arange(256) * 255 + 64) // 128, 255).astype(np.uint8)
+
+# PS2 data (MH1, MHG, MH2) is little endian and uses the GS CLUT layout, MHG Wii data is big endian and linear
+CLUT_VARIANTS = {
+    False: {'channels': [0,1,2,3], 'swizzle': True, 'ps2_alpha': True},
+    True: {'channels': [3,2,1,0], 'swizzle': False, 'ps2_alpha': False},
+}
+
+def decode_palette(pal_bytes, pal_bitdepth, big_endian=False):
+    variant = CLUT_VARIANTS[big_endian]
+    raw = np.frombuffer(pal_bytes, dtype=np.uint8)
+
+    if pal_bitdepth == 32:
+        palette = raw[:len(raw) // 4 * 4].reshape(-1, 4)[:, variant['channels']]
+        # Only rescale alpha stored in the GS 0x00-0x80 range
+        if variant['ps2_alpha'] and len(palette) and palette[:, 3].max() <= 0x80:
+            palette[:, 3] = EXPAND_PS2_ALPHA[palette[:, 3]]
+    elif pal_bitdepth == 16:
+        pairs = raw[:len(raw) // 2 * 2].reshape(-1, 2)
+        if big_endian:
+            pairs = pairs[:, ::-1]
+        nibbles = np.stack((pairs[:, 0] & 0xF, pairs[:, 0] >> 4, pairs[:, 1] & 0xF, pairs[:, 1] >> 4), axis=1)
+        palette = EXPAND_4BIT[nibbles]
     else:
-        c_r = NikkiReader.read_uint4(apx) / 255.0
-        apx.seek(-1,1)
-        c_g = NikkiReader.read_uint4(apx,True) / 255.0
-        c_b = NikkiReader.read_uint4(apx) / 255.0
-        apx.seek(-1,1)
-        c_a = NikkiReader.read_uint4(apx,True) / 255.0
-    return [c_r,c_g,c_b,c_a]
-
-def apx_decode(apx, idx):
+        print(f"Palette Bit Depth = {pal_bitdepth}")
+        palette = np.zeros((0, 4), dtype=np.uint8)
+
+    if variant['swizzle'] and len(palette) == 256:
+        palette = palette[CLUT_SWIZZLE]
+
+    # Pad so out of range indices read as transparent black instead of failing
+    padded = np.zeros((256, 4), dtype=np.uint8)
+    padded[:min(len(palette), 256)] = palette[:256]
+    return padded
+
+def apx_decode(apx):
     apx_pixelcount = NikkiReader.read_uint32(apx)
     pal_size = NikkiReader.read_uint32(apx)
     apx_bitdepth = NikkiReader.read_uint16(apx)
@@ -45,53 +60,67 @@ def apx_decode(apx, idx):
     pal_index = NikkiReader.read_uint16(apx)
     unk1 = NikkiReader.read_uint32(apx)
     unk2 = NikkiReader.read_uint32(apx)
-        
-    palette_data = []
-    image_data = np.zeros((apx_height,apx_width,4), dtype=np.float32)
-    
-    apx_imgOfs = apx.tell()
-    
-    apx.seek(apx_pixelcount,1)
-    
-    if pal_bitdepth == 32:
-        for n in range(pal_size//4):
-            palette_data.append(pal_rgba32(apx))
-    elif pal_bitdepth == 16:
-        for n in range(pal_size//2):
-            palette_data.append(pal_rgba16(apx))
-    else:
-        print(f"Palette Bit Depth = {pal_bitdepth}")
-    
-    apx.seek(apx_imgOfs)
-    if apx_bitdepth == 8:
-        for y in range(apx_height):
-            for x in range(apx_width):
-                palid = NikkiReader.read_byte(apx)
-                color = palette_data[palid]
-                image_data[apx_height - y - 1, x] = color  # Flip Y correctly
 
+    pixel_bytes = np.frombuffer(apx.read(apx_pixelcount), dtype=np.uint8)
+    palette_data = decode_palette(apx.read(pal_size), pal_bitdepth, NikkiReader._big_endian)
+    pixel_total = apx_width * apx_height
+
+    if apx_bitdepth == 8:
+        indices = pixel_bytes[:pixel_total]
     elif apx_bitdepth == 4:
-        for y in range(apx_height):
-            for x in range(apx_width):
-                if x % 2 == 0:
-                    palid = NikkiReader.read_uint4(apx)
-                    apx.seek(-1,1)
-                else:
-                    palid = NikkiReader.read_uint4(apx, True)
-                color = palette_data[palid]
-                image_data[apx_height - y - 1, x] = color  # Flip Y correctly
+        # Low nibble holds the left pixel
+        indices = np.empty(len(pixel_bytes) * 2, dtype=np.uint8)
+        indices[0::2] = pixel_bytes & 0xF
+        indices[1::2] = pixel_bytes >> 4
+        indices = indices[:pixel_total]
     else:
         print(f"Image Bit Depth = {apx_bitdepth} at {apx.tell():8X}")
-        
-    flattened_data = image_data.flatten()
-    
-    image = bpy.data.images.new(f"Tex Image {idx}", width=apx_width, height=apx_height)
-    image.pixels = flattened_data.tolist()
-    image.update
+        return np.zeros((apx_height,apx_width,4), dtype=np.uint8)
+
+    image_data = np.zeros((pixel_total, 4), dtype=np.uint8)
+    image_data[:len(indices)] = palette_data[indices]
+    return np.ascontiguousarray(image_data.reshape(apx_height, apx_width, 4)[::-1])  # Flip Y correctly
+
+def png_encode(image_data):
+    # image_data is (H,W,4) uint8 in Blender row order (bottom row first)
+    apx_height, apx_width = image_data.shape[:2]
+    raw = np.zeros((apx_height, apx_width * 4 + 1), dtype=np.uint8)
+    raw[:, 1:] = image_data[::-1].reshape(apx_height, -1)
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    header = struct.pack('>IIBBBBB', apx_width, apx_height, 8, 6, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)) + chunk(b'IEND', b'')
+
+def create_image(image_data, idx, packed=False):
+    apx_height, apx_width = image_data.shape[:2]
+    image = bpy.data.images.new(f"Tex Image {idx}", width=apx_width, height=apx_height, alpha=True)
+
+    if packed:
+        # Stored as 8-bit PNG inside the .blend instead of a float pixel buffer
+        png_data = png_encode(image_data)
+        image.pack(data=png_data, data_len=len(png_data))
+        image.source = 'FILE'
+    else:
+        pixels = np.empty(image_data.size, dtype=np.float32)
+        np.multiply(image_data.reshape(-1), 1.0 / 255.0, out=pixels)
+        image.pixels.foreach_set(pixels)
+        image.update()
     return image
 
-def parse_tex(filepath):
-    images = []
+def downsample_image(image_data, factor):
+    # Box filter, each output texel averages a factor x factor block
+    apx_height, apx_width = image_data.shape[:2]
+    factor = max(1, min(factor, apx_height, apx_width))
+    if factor == 1:
+        return image_data
+    blocks = image_data[:apx_height // factor * factor, :apx_width // factor * factor].astype(np.uint16)
+    blocks = blocks.reshape(apx_height // factor, factor, apx_width // factor, factor, 4)
+    return ((blocks.sum(axis=(1,3)) + factor * factor // 2) // (factor * factor)).astype(np.uint8)
+
+def read_tex(filepath, detail=1):
+    textures = []
 
     file_meta = []
 
@@ -112,6 +141,5 @@ def parse_tex(filepath):
         for idx, subfile in enumerate(file_meta):
             apx = NikkiReader.create_subfile(file, subfile[0], subfile[1])
             apx_size = NikkiReader.read_uint32(apx)
-            image = apx_decode(apx, idx)
-            images.append(image.name)
-    return images
\ No newline at end of file
+            textures.append(downsample_image(apx_decode(apx), detail))
+    return textures